@@ -0,0 +1,9 @@
+"""ASGI entry point for the medical LLM API.
+
+Run with:
+    uvicorn asgi:app --workers 1 --port 4000
+"""
+from medical_llm_api import app
+
+if __name__ == "__main__":
+    app.run()
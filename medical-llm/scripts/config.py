@@ -1,16 +1,25 @@
-import os
-
-class Config:
-    # OpenAI API key for accessing the Palmyra-Med-70B-32K model
-    NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
-
-    # Firestore credentials (path to the JSON key file)
-    FIRESTORE_CREDENTIALS = os.getenv("FIRESTORE_CREDENTIALS")
-
-    # Flask-specific settings
-    FLASK_ENV = os.getenv("FLASK_ENV", "production")
-    FLASK_DEBUG = os.getenv("FLASK_DEBUG", "False").lower() in ['true', '1', 't']
-
-# Create a config instance
-config = Config()
-
+import os
+import httpx
+
+class Config:
+    # OpenAI API key for accessing the Palmyra-Med-70B-32K model
+    NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
+
+    # NVIDIA's OpenAI-compatible API endpoint
+    NVIDIA_API_BASE_URL = "https://integrate.api.nvidia.com/v1"
+
+    # Connection pooling for the NVIDIA API: HTTP/2 with a sized keep-alive
+    # pool so back-to-back LLM calls reuse connections instead of paying a
+    # TLS handshake each time. Shared by the sync and async clients.
+    HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+    HTTP_TIMEOUT = httpx.Timeout(connect=5, read=120, write=10, pool=5)
+
+    # Firestore credentials (path to the JSON key file)
+    FIRESTORE_CREDENTIALS = os.getenv("FIRESTORE_CREDENTIALS")
+
+    # Flask-specific settings
+    FLASK_ENV = os.getenv("FLASK_ENV", "production")
+    FLASK_DEBUG = os.getenv("FLASK_DEBUG", "False").lower() in ['true', '1', 't']
+
+# Create a config instance
+config = Config()
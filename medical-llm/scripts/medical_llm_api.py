@@ -1,12 +1,12 @@
-from flask import Flask, request, jsonify, stream_with_context, Response
-from flask_cors import CORS
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
 from medical_llm_service import ask_ai_about_patient_reports
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+app = Quart(__name__)
+app = cors(app)  # Enable CORS for all routes
 
 @app.route('/api/ask_ai', methods=['POST'])
-def ask_ai():
+async def ask_ai():
     """
         API endpoint to send a user's ID, patient's ID, and a question, and receive a response from the AI based on patient reports.
 
@@ -21,11 +21,13 @@ def ask_ai():
 
         Returns:
             - 200 OK: A streamed AI response based on the patient reports and the given question.
+              Failures during generation are streamed as a trailing "[error] ..." line,
+              since the 200 and headers have already been sent by then.
             - 400 Bad Request: If 'user_id', 'patient_id', or 'question' is missing in the request.
                 {
                     "error": "Missing user_id, patient_id, or question in request"
                 }
-            - 500 Internal Server Error: If an error occurs during processing.
+            - 500 Internal Server Error: If an error occurs before streaming starts.
                 {
                     "error": "[Error message]"
                 }
@@ -35,7 +37,7 @@ def ask_ai():
     """
     try:
         # Extract data from the request
-        data = request.json
+        data = await request.get_json()
         user_id = data.get('user_id')  # Fetch the user_id from the request
         patient_id = data.get('patient_id')  # Fetch the patient_id from the request
         question = data.get('question')  # Fetch the question from the request
@@ -44,20 +46,27 @@ def ask_ai():
         if not user_id or not patient_id or not question:
             return jsonify({"error": "Missing user_id, patient_id, or question in request"}), 400
 
-        # Function to generate the response
-        def generate():
-            # Pass user_id to the function handling AI interaction (if required)
-            response = ask_ai_about_patient_reports(user_id, patient_id, question)
-            yield response
+        # Stream each token delta to the client as the model produces it.
+        # Errors must be caught inside the generator: by the time iteration
+        # fails, the 200 and headers are already on the wire, so the caller
+        # would otherwise just see a silently truncated stream.
+        async def generate():
+            try:
+                async for chunk in ask_ai_about_patient_reports(user_id, patient_id, question):
+                    yield chunk
+            except Exception as e:
+                app.logger.exception('Error while streaming AI response')
+                yield f"\n[error] {str(e)}"
 
-        # Return the response
-        return Response(stream_with_context(generate()), content_type='text/plain')
+        return Response(generate(), content_type='text/event-stream')
 
     except Exception as e:
         # Handle any unexpected errors
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, port=4000)
+    # Development only. In production run under an ASGI server:
+    #   uvicorn asgi:app --workers 1 --port 4000
+    app.run(debug=False, port=4000)
 
 
@@ -1,279 +1,367 @@
-import logging
-from google.cloud import firestore
-from openai import OpenAI
-from config import config
-from datetime import datetime
-from google.cloud.firestore import SERVER_TIMESTAMP
-from google.cloud.firestore_v1 import SERVER_TIMESTAMP as TIMESTAMP
-
-# Initialize Firestore client
-db = firestore.Client.from_service_account_json(config.FIRESTORE_CREDENTIALS)
-
-# Initialize OpenAI client with NVIDIA's API
-client = OpenAI(
-    base_url="https://integrate.api.nvidia.com/v1",  # NVIDIA's API URL
-    api_key=config.NVIDIA_API_KEY
-)
-
-# Setup logging
-logging.basicConfig(level=logging.INFO)
-
-FIRESTORE_LIMIT = 1 * 1024 * 1024  # 1 MB limit
-
-
-def start_new_session(user_id, patient_id):
-    """
-        Start a new conversation session for the specified user and patient.
-        This creates a new Firestore document under the 'conversations' collection for that patient.
-
-        Args:
-            user_id (str): The ID of the user.
-            patient_id (str): The ID of the patient.
-
-        Returns:
-            str: The session ID of the newly created session.
-    """
-    session_id = f"session_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
-        'conversations').document(session_id)
-    session_ref.set({
-        'sessionStart': firestore.SERVER_TIMESTAMP,  # Use server timestamp for the session start time
-        'messages': [],
-        'reports_included': False,  # Track if patient reports have been included
-        'last_fetch_time': firestore.SERVER_TIMESTAMP  # Store the fetch time as a Firestore Timestamp
-    })
-    logging.info(f"Started a new session with ID: {session_id}")
-    return session_id
-
-
-def update_last_fetch_time(user_id, patient_id, session_id):
-    """
-        Update the last fetch time of the session to the current server time.
-
-        Args:
-            user_id (str): The ID of the user.
-            patient_id (str): The ID of the patient.
-            session_id (str): The session ID to update.
-    """
-    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
-        'conversations').document(session_id)
-    session_ref.update({
-        'last_fetch_time': firestore.SERVER_TIMESTAMP  # Update last fetch time as a Firestore Timestamp
-    })
-    logging.info(f"Updated last fetch time for session ID: {session_id}")
-
-
-def save_message_to_session(user_id, patient_id, session_id, role, content):
-    """
-        Save a message to an ongoing conversation session. If the session size exceeds the Firestore limit,
-        start a new session.
-
-        Args:
-            user_id (str): The ID of the user.
-            patient_id (str): The ID of the patient.
-            session_id (str): The session ID to save the message in.
-            role (str): The role of the message sender (e.g., 'user' or 'assistant').
-            content (str): The content of the message.
-    """
-    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
-        'conversations').document(session_id)
-    session_data = session_ref.get().to_dict()
-
-    messages = session_data.get('messages', [])
-    current_size = sum(len(m['content']) for m in messages) + len(content)
-
-    if current_size > FIRESTORE_LIMIT:
-        logging.info(f"Session {session_id} is too large. Starting a new session.")
-        session_id = start_new_session(user_id, patient_id)
-        session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
-            'conversations').document(session_id)
-
-    # Save the message with a timestamp
-    session_ref.update({
-        'messages': firestore.ArrayUnion([{
-            'role': role,
-            'content': content,
-            'timestamp': datetime.utcnow().isoformat()  # Store as an ISO string for simplicity
-        }])
-    })
-
-
-def get_conversation_history(user_id, patient_id, session_id):
-    """
-        Retrieve the conversation history for the given user, patient, and session.
-
-        Args:
-            user_id (str): The ID of the user.
-            patient_id (str): The ID of the patient.
-            session_id (str): The session ID to fetch the history from.
-
-        Returns:
-            list: A list of messages in the conversation.
-    """
-    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
-        'conversations').document(session_id)
-    session_data = session_ref.get()
-
-    if session_data.exists:
-        return session_data.to_dict().get('messages', [])
-    return []
-
-
-def get_current_session_id(user_id, patient_id):
-    """
-        Retrieve the latest session ID for the user and patient, or create a new session if none exists.
-
-        Args:
-            user_id (str): The ID of the user.
-            patient_id (str): The ID of the patient.
-
-        Returns:
-            str: The session ID.
-    """
-    sessions_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
-        'conversations')
-    sessions = sessions_ref.order_by('sessionStart', direction=firestore.Query.DESCENDING).limit(1).stream()
-    latest_session = next(sessions, None)
-    if latest_session:
-        logging.info(f"Using existing session with ID: {latest_session.id}")
-    else:
-        logging.info(f"No existing session found. Starting a new one.")
-    return latest_session.id if latest_session else start_new_session(user_id, patient_id)
-
-
-def get_patient_radiology_reports(patient_id, last_fetch_time=None):
-    """
-        Retrieve radiology reports for the specified patient, optionally filtering by a timestamp.
-
-        Args:
-            patient_id (str): The ID of the patient.
-            last_fetch_time (Timestamp, optional): Only retrieve reports created after this time.
-
-        Returns:
-            list: A list of radiology report documents.
-    """
-    logging.info(f"Retrieving reports for patient ID: {patient_id}")
-    reports_ref = db.collection('Patients').document(patient_id).collection('RadiologyReports')
-
-    if last_fetch_time:
-        logging.info(f"Querying for reports with created_at > {last_fetch_time}")
-        reports = reports_ref.where('created_at', '>', last_fetch_time).stream()
-    else:
-        logging.info("Querying for all reports (no last_fetch_time provided)")
-        reports = reports_ref.stream()
-
-    report_list = []
-    for report in reports:
-        report_data = report.to_dict()
-        report_id = report.id  # Retrieve the reportId from Firestore document ID
-        report_data['reportId'] = report_id  # Add reportId to the dictionary
-        logging.info(f"Retrieved Report ID: {report_id}")
-        report_list.append(report_data)
-
-    if len(report_list) == 0:
-        logging.info(f"No new reports found for patient ID: {patient_id}")
-    else:
-        logging.info(f"Found {len(report_list)} reports for patient ID: {patient_id}")
-
-    return report_list
-
-
-def create_flexible_prompt(patient_id, question, reports):
-    """
-    Create a flexible prompt that includes all patient reports and the radiologist's question,
-    ensuring that no reports are missed.
-
-    Args:
-        patient_id (str): The ID of the patient.
-        question (str): The question from the radiologist.
-        reports (list): List of patient radiology reports.
-
-    Returns:
-        str: The generated prompt to be sent to the AI model.
-    """
-    prompt = "Based on the following patient history and radiology reports, please answer the question below:\n\n"
-    prompt += f"Patient ID: {patient_id}\n\n"
-
-    for report in reports:
-        # Include the reportId and patientName in the prompt
-        prompt += f"Report ID: {report.get('reportId', 'N/A')}\n"
-        prompt += f"Patient Name: {report.get('patientName', 'N/A')}\n"
-        prompt += f"- Report Date: {report.get('reportDate', 'N/A')} (Created At: {report.get('created_at', 'N/A')})\n"
-        prompt += f"  - Type of Study: {report.get('typeOfStudy', 'N/A')}\n"
-        prompt += f"  - Clinical History: {report.get('clinicalHistory', 'N/A')}\n"
-        prompt += f"  - Findings:\n"
-        prompt += f"    - Airways: {report.get('airways', 'N/A')}\n"
-        prompt += f"    - Left Lung: {report.get('leftLung', 'N/A')}\n"
-        prompt += f"    - Right Lung: {report.get('rightLung', 'N/A')}\n"
-        prompt += f"    - Pleura: {report.get('pleura', 'N/A')}\n"
-        prompt += f"  - Impression: {report.get('impression', 'N/A')}\n"
-        prompt += f"  - Technique: {report.get('technique', 'N/A')}\n"
-        prompt += "\n"
-
-    prompt += f"Radiologist's Question: {question}\n"
-
-    logging.info(f"Generated prompt for AI:\n{prompt}")
-
-    return prompt
-
-
-def ask_ai_about_patient_reports(user_id, patient_id, question):
-    """
-        Handle the AI interaction by generating a prompt based on the user's patient reports and the radiologist's question.
-        Track session history and updates.
-
-        Args:
-            user_id (str): The ID of the user.
-            patient_id (str): The ID of the patient.
-            question (str): The radiologist's question.
-
-        Returns:
-            str: The AI-generated response.
-    """
-    session_id = get_current_session_id(user_id, patient_id)
-    conversation_history = get_conversation_history(user_id, patient_id, session_id)
-
-    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection('conversations').document(session_id)
-    session_data = session_ref.get().to_dict()
-
-    reports_included = session_data.get('reports_included', False)
-    last_fetch_time = session_data.get('last_fetch_time')
-
-    if not reports_included:
-        # Include all reports in the initial session
-        reports = get_patient_radiology_reports(patient_id)
-        if not reports:
-            return "No reports found for this patient."
-        prompt = create_flexible_prompt(patient_id, question, reports)
-        session_ref.update({'reports_included': True, 'last_fetch_time': firestore.SERVER_TIMESTAMP})
-        logging.info(f"Included the following patient reports in the prompt:\n{reports}")
-    else:
-        # Check for new reports since the last fetch time
-        new_reports = get_patient_radiology_reports(patient_id, last_fetch_time)
-        if new_reports:
-            logging.info(f"New reports found: {new_reports}")
-            all_reports = get_patient_radiology_reports(patient_id)
-            prompt = create_flexible_prompt(patient_id, question, all_reports)
-            session_ref.update({'last_fetch_time': firestore.SERVER_TIMESTAMP})
-        else:
-            logging.info("No new reports found.")
-            prompt = question
-
-    conversation_history.append({"role": "user", "content": prompt})
-
-    completion = client.chat.completions.create(
-        model="writer/palmyra-med-70b-32k",
-        messages=conversation_history,
-        temperature=0.4,
-        top_p=0.7,
-        max_tokens=1500,
-        stream=False
-    )
-
-    response = completion.choices[0].message.content
-    logging.info(f"AI Response:\n{response}")
-
-    save_message_to_session(user_id, patient_id, session_id, "user", prompt)
-    save_message_to_session(user_id, patient_id, session_id, "assistant", response)
-
-    return response
+import logging
+import uuid
+import httpx
+from collections import defaultdict
+from cachetools import TTLCache
+from google.cloud import firestore
+from openai import AsyncOpenAI
+from config import config
+from datetime import datetime
+from google.cloud.firestore import SERVER_TIMESTAMP
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP as TIMESTAMP
+
+# Initialize the async Firestore client -- the worker is never blocked on a
+# Firestore round-trip while other requests wait.
+db = firestore.AsyncClient.from_service_account_json(config.FIRESTORE_CREDENTIALS)
+
+# Initialize the async OpenAI client with NVIDIA's API; the multi-second LLM
+# generation no longer ties up the worker thread. The explicit HTTP/2
+# keep-alive transport reuses connections across back-to-back calls.
+client = AsyncOpenAI(
+    base_url=config.NVIDIA_API_BASE_URL,
+    api_key=config.NVIDIA_API_KEY,
+    http_client=httpx.AsyncClient(http2=True, limits=config.HTTP_LIMITS, timeout=config.HTTP_TIMEOUT)
+)
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+
+# Template rendered once per report when building the AI prompt. Missing
+# fields fall back to 'N/A' via a defaultdict in create_flexible_prompt.
+REPORT_TEMPLATE = (
+    "Report ID: {reportId}\n"
+    "Patient Name: {patientName}\n"
+    "- Report Date: {reportDate} (Created At: {created_at})\n"
+    "  - Type of Study: {typeOfStudy}\n"
+    "  - Clinical History: {clinicalHistory}\n"
+    "  - Findings:\n"
+    "    - Airways: {airways}\n"
+    "    - Left Lung: {leftLung}\n"
+    "    - Right Lung: {rightLung}\n"
+    "    - Pleura: {pleura}\n"
+    "  - Impression: {impression}\n"
+    "  - Technique: {technique}\n"
+    "\n"
+)
+
+# Maximum number of recent messages fed back to the model as context.
+# The 32k-context model does not need the whole session history.
+MAX_CONTEXT_MESSAGES = 40
+
+# Maximum number of user/assistant pairs sent to the model per request.
+# Prompt tokens dominate LLM latency and cost, so older turns are trimmed.
+MAX_TURNS = 10
+
+# Process-local cache of the latest session id per (user_id, patient_id),
+# so repeated conversational turns skip the Firestore query entirely.
+_SESSION_ID_CACHE = TTLCache(maxsize=1024, ttl=60)
+
+# Short-lived cache of each patient's radiology reports; reports rarely
+# change within a session, so conversational turns skip the full refetch.
+_REPORTS_CACHE = TTLCache(maxsize=1024, ttl=60)
+
+
+async def start_new_session(user_id, patient_id):
+    """
+        Start a new conversation session for the specified user and patient.
+        This creates a new Firestore document under the 'conversations' collection for that patient.
+
+        Args:
+            user_id (str): The ID of the user.
+            patient_id (str): The ID of the patient.
+
+        Returns:
+            str: The session ID of the newly created session.
+    """
+    # uuid4 instead of a second-resolution strftime id: concurrent requests
+    # for the same patient can no longer collide and overwrite each other.
+    # Ordering comes from the sessionStart server timestamp, not the id.
+    session_id = f"session_{uuid.uuid4().hex}"
+    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
+        'conversations').document(session_id)
+    await session_ref.set({
+        'sessionStart': firestore.SERVER_TIMESTAMP,  # Use server timestamp for the session start time
+        'reports_included': False,  # Track if patient reports have been included
+        'last_fetch_time': firestore.SERVER_TIMESTAMP,  # Store the fetch time as a Firestore Timestamp
+        'bytes_used': 0  # Running total of message content bytes in this session
+    })
+    logging.info(f"Started a new session with ID: {session_id}")
+    _SESSION_ID_CACHE[(user_id, patient_id)] = session_id
+    return session_id
+
+
+def _message_doc_id():
+    """Generate a timestamp-sortable, collision-safe document ID for a message."""
+    return f"msg_{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}"
+
+
+async def get_conversation_history(user_id, patient_id, session_id):
+    """
+        Retrieve the most recent conversation history for the given user, patient,
+        and session, capped at MAX_CONTEXT_MESSAGES messages.
+
+        Args:
+            user_id (str): The ID of the user.
+            patient_id (str): The ID of the patient.
+            session_id (str): The session ID to fetch the history from.
+
+        Returns:
+            list: A list of messages in the conversation, oldest first.
+    """
+    messages_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
+        'conversations').document(session_id).collection('messages')
+    messages = messages_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(
+        MAX_CONTEXT_MESSAGES).stream()
+    history = [{'role': m.get('role'), 'content': m.get('content')} async for m in messages]
+    history.reverse()  # Oldest first, as the chat API expects
+    return history
+
+
+async def get_current_session_id(user_id, patient_id):
+    """
+        Retrieve the latest session ID for the user and patient, or create a new session if none exists.
+
+        Args:
+            user_id (str): The ID of the user.
+            patient_id (str): The ID of the patient.
+
+        Returns:
+            str: The session ID.
+    """
+    cached = _SESSION_ID_CACHE.get((user_id, patient_id))
+    if cached is not None:
+        return cached
+
+    sessions_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection(
+        'conversations')
+    # Field mask: only the id and sessionStart come back over the wire, not
+    # the whole session document (reports_context alone can be tens of KB)
+    sessions = sessions_ref.select(['sessionStart']).order_by(
+        'sessionStart', direction=firestore.Query.DESCENDING).limit(1).stream()
+    latest_session = None
+    async for session in sessions:
+        latest_session = session
+    if latest_session:
+        logging.info(f"Using existing session with ID: {latest_session.id}")
+        _SESSION_ID_CACHE[(user_id, patient_id)] = latest_session.id
+        return latest_session.id
+    logging.info(f"No existing session found. Starting a new one.")
+    return await start_new_session(user_id, patient_id)
+
+
+async def get_patient_radiology_reports(patient_id, last_fetch_time=None):
+    """
+        Retrieve radiology reports for the specified patient, optionally filtering by a timestamp.
+
+        Args:
+            patient_id (str): The ID of the patient.
+            last_fetch_time (Timestamp, optional): Only retrieve reports created after this time.
+
+        Returns:
+            list: A list of radiology report documents.
+    """
+    logging.info(f"Retrieving reports for patient ID: {patient_id}")
+    reports_ref = db.collection('Patients').document(patient_id).collection('RadiologyReports')
+
+    if last_fetch_time:
+        logging.info(f"Querying for reports with created_at > {last_fetch_time}")
+        reports = reports_ref.where('created_at', '>', last_fetch_time).stream()
+    else:
+        logging.info("Querying for all reports (no last_fetch_time provided)")
+        reports = reports_ref.stream()
+
+    report_list = []
+    async for report in reports:
+        report_data = report.to_dict()
+        report_id = report.id  # Retrieve the reportId from Firestore document ID
+        report_data['reportId'] = report_id  # Add reportId to the dictionary
+        logging.info(f"Retrieved Report ID: {report_id}")
+        report_list.append(report_data)
+
+    if len(report_list) == 0:
+        logging.info(f"No new reports found for patient ID: {patient_id}")
+    else:
+        logging.info(f"Found {len(report_list)} reports for patient ID: {patient_id}")
+
+    return report_list
+
+
+def _latest_report_time(reports):
+    """Return the max created_at across the given reports, or None if none
+    carry one. Used to stamp last_fetch_time from the reports actually
+    included, so a report created concurrently is never skipped by the
+    created_at > last_fetch_time delta query."""
+    times = [r.get('created_at') for r in reports if r.get('created_at') is not None]
+    return max(times) if times else None
+
+
+async def get_patient_radiology_reports_cached(patient_id):
+    """
+        Retrieve all radiology reports for the patient, served from the
+        short-TTL in-process cache when possible.
+
+        Args:
+            patient_id (str): The ID of the patient.
+
+        Returns:
+            list: A list of radiology report documents.
+    """
+    reports = _REPORTS_CACHE.get(patient_id)
+    if reports is not None:
+        return reports
+    reports = await get_patient_radiology_reports(patient_id)
+    _REPORTS_CACHE[patient_id] = reports
+    return reports
+
+
+def create_reports_context(patient_id, reports):
+    """
+    Render all patient reports into the system message that anchors the
+    conversation, ensuring that no reports are missed. Sent once per session
+    instead of being embedded in every user turn.
+
+    Args:
+        patient_id (str): The ID of the patient.
+        reports (list): List of patient radiology reports.
+
+    Returns:
+        str: The reports context for the system message.
+    """
+    parts = [
+        "You are assisting a radiologist. Answer their questions based on the "
+        "following patient history and radiology reports:\n\n",
+        f"Patient ID: {patient_id}\n\n"
+    ]
+
+    for report in reports:
+        fields = defaultdict(lambda: 'N/A', report)
+        parts.append(REPORT_TEMPLATE.format_map(fields))
+
+    return "".join(parts)
+
+
+async def ask_ai_about_patient_reports(user_id, patient_id, question):
+    """
+        Handle the AI interaction by generating a prompt based on the user's patient reports and the radiologist's question.
+        Track session history and updates.
+
+        Args:
+            user_id (str): The ID of the user.
+            patient_id (str): The ID of the patient.
+            question (str): The radiologist's question.
+
+        Yields:
+            str: Chunks of the AI-generated response as they arrive from the model.
+    """
+    session_id = await get_current_session_id(user_id, patient_id)
+
+    # Single metadata read; the recent history comes from one paginated
+    # query over the messages subcollection.
+    session_ref = db.collection('Users').document(user_id).collection('patients').document(patient_id).collection('conversations').document(session_id)
+    snapshot = await session_ref.get()
+    session_data = snapshot.to_dict() if snapshot.exists else {}
+
+    conversation_history = await get_conversation_history(user_id, patient_id, session_id)
+    reports_included = session_data.get('reports_included', False)
+    last_fetch_time = session_data.get('last_fetch_time')
+    reports_context = session_data.get('reports_context')
+
+    new_fetch_time = None
+    context_changed = False
+
+    if not reports_included or reports_context is None:
+        # Build the reports context once; it anchors the whole session as a
+        # system message instead of being resent inside every user turn.
+        # Bypass the TTL cache here: a stale entry filled by another session
+        # could silently drop a report created in the last 60 seconds.
+        reports = await get_patient_radiology_reports(patient_id)
+        if not reports:
+            yield "No reports found for this patient."
+            return
+        _REPORTS_CACHE[patient_id] = reports
+        reports_context = create_reports_context(patient_id, reports)
+        new_fetch_time = _latest_report_time(reports)
+        context_changed = True
+        logging.info(f"Included {len(reports)} patient reports in the session context.")
+    else:
+        # Fetch only reports created since the last fetch and extend the
+        # cached prior list -- no second full stream of the collection.
+        new_reports = await get_patient_radiology_reports(patient_id, last_fetch_time)
+        if new_reports:
+            logging.info(f"Found {len(new_reports)} new reports since last fetch.")
+            prior_reports = _REPORTS_CACHE.get(patient_id)
+            if prior_reports is not None:
+                # The cache may already contain some of the delta (another
+                # request can refresh it after a report lands but before this
+                # session's last_fetch_time catches up), so merge by reportId
+                prior_ids = {r.get('reportId') for r in prior_reports}
+                all_reports = prior_reports + [
+                    r for r in new_reports if r.get('reportId') not in prior_ids
+                ]
+                _REPORTS_CACHE[patient_id] = all_reports
+            else:
+                # Cache expired: one full stream rebuilds it
+                all_reports = await get_patient_radiology_reports_cached(patient_id)
+            reports_context = create_reports_context(patient_id, all_reports)
+            new_fetch_time = _latest_report_time(new_reports)
+            context_changed = True
+        else:
+            logging.info("No new reports found.")
+
+    # Anchor system message + the most recent turns + the new question; the
+    # reports are never duplicated into user turns, so tokens per request
+    # stay linear in conversation length instead of quadratic.
+    messages = ([{"role": "system", "content": reports_context}]
+                + conversation_history[-MAX_TURNS * 2:]
+                + [{"role": "user", "content": question}])
+
+    completion = await client.chat.completions.create(
+        model="writer/palmyra-med-70b-32k",
+        messages=messages,
+        temperature=0.4,
+        top_p=0.7,
+        max_tokens=1500,
+        stream=True
+    )
+
+    # Stream tokens to the caller as they arrive, accumulating them so the
+    # full response is written to Firestore only once after generation ends.
+    parts = []
+    async for chunk in completion:
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    response = "".join(parts)
+    logging.info(f"AI Response:\n{response}")
+
+    # Single terminal write: both message docs and the session metadata
+    # update are committed in one batch.
+    messages_ref = session_ref.collection('messages')
+    batch = db.batch()
+    batch.set(messages_ref.document(_message_doc_id()), {
+        'role': 'user',
+        'content': question,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    })
+    batch.set(messages_ref.document(_message_doc_id()), {
+        'role': 'assistant',
+        'content': response,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    })
+    session_update = {
+        'reports_included': True,
+        'bytes_used': firestore.Increment(len(question) + len(response))
+    }
+    # The rendered context can be tens of KB; re-upload it only when it was
+    # first built or rebuilt with new reports, not on every turn
+    if context_changed:
+        session_update['reports_context'] = reports_context
+    # Advance last_fetch_time only to the newest created_at actually
+    # included; a server timestamp would hide reports created between the
+    # fetch and this commit from every future delta query.
+    if new_fetch_time is not None:
+        session_update['last_fetch_time'] = new_fetch_time
+    batch.update(session_ref, session_update)
+    await batch.commit()
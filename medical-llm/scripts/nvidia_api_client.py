@@ -1,10 +1,13 @@
+import httpx
 from openai import OpenAI
-import config
+from config import config
 
-# Initialize the OpenAI client with NVIDIA's API URL and your API key
+# Initialize the OpenAI client with the shared endpoint and connection-pool
+# settings from config (the service itself uses the async variant)
 client = OpenAI(
-    base_url="https://integrate.api.nvidia.com/v1",  # NVIDIA's API URL
-    api_key=config.NVIDIA_API_KEY  # Replace with your actual API key
+    base_url=config.NVIDIA_API_BASE_URL,
+    api_key=config.NVIDIA_API_KEY,
+    http_client=httpx.Client(http2=True, limits=config.HTTP_LIMITS, timeout=config.HTTP_TIMEOUT)
 )
 
 # Create a chat completion using the Palmyra-Med-70B-32K model
@@ -1,98 +1,176 @@
 import base64
 import os
+import queue
+import threading
+import time
 import cv2
 import numpy as np
 from flask import Flask, request, jsonify, send_file
+from flask_compress import Compress
 import tensorflow as tf
 from keras.models import load_model
-from keras.utils import img_to_array
-import io
-from PIL import Image
-import matplotlib.pyplot as plt
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"  # Disable all GPUs
 tf.config.set_visible_devices([], 'GPU')
 
-app = Flask(__name__)
-
-model = None
+# CPU-only inference: use all physical cores within an op and keep
+# inter-op parallelism modest so concurrent requests don't thrash
+tf.config.threading.set_intra_op_parallelism_threads(os.cpu_count())
+tf.config.threading.set_inter_op_parallelism_threads(2)
 
-def load_model_once():
-    global model
-    if model is None:
-        model_path = os.getenv('MODEL_PATH', 'pneumonia_xray_classifier_new.h5')
-        model = load_model(model_path)
-        app.logger.info('Model loaded successfully')
-    return model
+app = Flask(__name__)
 
-def preprocess_image(image_bytes, img_size=(256, 256)):
+# Compress JSON responses: the base64 heatmap inflates the JPEG by ~33%
+# and compresses back to a fraction of its raw size over the wire
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+Compress(app)
+
+# Load the model at import time so the first request doesn't pay the
+# multi-second load + graph-tracing cost.
+MODEL = load_model(os.getenv('MODEL_PATH', 'pneumonia_xray_classifier_new.h5'))
+
+# Grad-CAM models cached per conv layer name -- building a functional
+# Keras model clones layers and rebuilds the graph, so never do it per request
+_GRAD_MODELS = {}
+
+def get_grad_model(last_conv_layer_name='mixed8'):
+    grad_model = _GRAD_MODELS.get(last_conv_layer_name)
+    if grad_model is None:
+        grad_model = tf.keras.models.Model(
+            [MODEL.inputs], [MODEL.get_layer(last_conv_layer_name).output, MODEL.output]
+        )
+        _GRAD_MODELS[last_conv_layer_name] = grad_model
+    return grad_model
+
+GRAD_MODEL = get_grad_model()
+
+# Optional int8 TFLite fast path for the forward pass (see quantize_model.py).
+# The FP32 Keras model above is still used for Grad-CAM, which needs gradients.
+TFLITE_MODEL_PATH = os.getenv('TFLITE_MODEL_PATH', 'pneumonia_xray_classifier_int8.tflite')
+INTERPRETER = None
+if os.path.exists(TFLITE_MODEL_PATH):
+    INTERPRETER = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH, num_threads=os.cpu_count())
+    INTERPRETER.allocate_tensors()
+    _TFLITE_INPUT = INTERPRETER.get_input_details()[0]
+    _TFLITE_OUTPUT = INTERPRETER.get_output_details()[0]
+    _TFLITE_BATCH = _TFLITE_INPUT['shape'][0]
+
+def _forward(batch):
+    """Run the forward pass on a (B,256,256,3) float32 batch, preferring the
+    int8 TFLite interpreter when available."""
+    global _TFLITE_BATCH
+    if INTERPRETER is None:
+        return MODEL(batch, training=False).numpy()
+
+    if batch.shape[0] != _TFLITE_BATCH:
+        INTERPRETER.resize_tensor_input(_TFLITE_INPUT['index'], list(batch.shape))
+        INTERPRETER.allocate_tensors()
+        _TFLITE_BATCH = batch.shape[0]
+
+    in_scale, in_zero = _TFLITE_INPUT['quantization']
+    # Round to nearest to match TFLite's affine quantization; astype alone
+    # truncates toward zero and biases every activation by up to 1 LSB
+    quantized = np.clip(np.round(batch / in_scale + in_zero), -128, 127).astype(np.int8)
+    INTERPRETER.set_tensor(_TFLITE_INPUT['index'], quantized)
+    INTERPRETER.invoke()
+    out = INTERPRETER.get_tensor(_TFLITE_OUTPUT['index'])
+    out_scale, out_zero = _TFLITE_OUTPUT['quantization']
+    return (out.astype(np.float32) - out_zero) * out_scale
+
+# Micro-batching: concurrent requests are collected for up to 5 ms and run
+# through the model as one (B,256,256,3) forward pass instead of B separate
+# dispatches, which costs the same FLOPs per image but far less overhead.
+BATCH_SIZE = 8
+BATCH_TIMEOUT_S = 0.005
+
+_PREDICT_QUEUE = queue.Queue()
+
+def _batch_worker():
+    while True:
+        jobs = [_PREDICT_QUEUE.get()]
+        deadline = time.monotonic() + BATCH_TIMEOUT_S
+        while len(jobs) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(_PREDICT_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            batch = np.concatenate([job['tensor'] for job in jobs], axis=0)
+            preds = _forward(batch)
+            for job, pred in zip(jobs, preds):
+                job['result'] = float(pred[0])
+        except Exception as e:
+            for job in jobs:
+                job['error'] = e
+        for job in jobs:
+            job['done'].set()
+
+threading.Thread(target=_batch_worker, daemon=True).start()
+
+def predict_proba(img_tensor):
+    """Submit a (1,256,256,3) tensor to the batching worker and block until
+    its prediction is available."""
+    job = {'tensor': img_tensor, 'result': None, 'error': None, 'done': threading.Event()}
+    _PREDICT_QUEUE.put(job)
+    job['done'].wait()
+    if job['error'] is not None:
+        raise job['error']
+    return job['result']
+
+def decode_and_prep(image_bytes, img_size=(256, 256)):
+    """Decode the image once and return both the full-resolution RGB image
+    (for visualization) and the normalized float32 model input tensor."""
     img_arr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = cv2.resize(img, img_size)
-    img = img_to_array(img)  # Convert image to numpy array
-    img = img / 255.0  # Rescale
-    img = np.expand_dims(img, axis=0)  # Add batch dimension
-    return img
-
-def make_gradcam_heatmap(img_array, model, last_conv_layer_name, pred_index=None):
-    grad_model = tf.keras.models.Model(
-        [model.inputs], [model.get_layer(last_conv_layer_name).output, model.output]
-    )
-
-    with tf.GradientTape() as tape:
-        last_conv_layer_output, preds = grad_model(img_array)
-        if pred_index is None:
+    bgr = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    small = cv2.resize(rgb, img_size, interpolation=cv2.INTER_AREA)
+    # Normalize in float32 to avoid an implicit float64 upcast
+    tensor = (small.astype(np.float32) * np.float32(1.0 / 255.0))[None, ...]
+    return rgb, tensor
+
+@tf.function(input_signature=[tf.TensorSpec([1, 256, 256, 3], tf.float32)])
+def infer_and_explain(x):
+    """Run the forward pass, Grad-CAM heatmap, and guided-backprop gradients
+    in a single compiled graph so each request pays one TF dispatch instead
+    of three eager calls (and no per-request retracing)."""
+    with tf.GradientTape() as guided_tape:
+        guided_tape.watch(x)
+        with tf.GradientTape() as cam_tape:
+            conv_output, preds = GRAD_MODEL(x)
             pred_index = tf.argmax(preds[0])
-        class_channel = preds[:, pred_index]
-
-    grads = tape.gradient(class_channel, last_conv_layer_output)
+            class_channel = preds[:, pred_index]
+        grads = cam_tape.gradient(class_channel, conv_output)
     pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
 
-    last_conv_layer_output = last_conv_layer_output[0]
-    heatmap = last_conv_layer_output @ pooled_grads[..., tf.newaxis]
-    heatmap = tf.squeeze(heatmap)
-
-    heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
-    return heatmap.numpy()
-
-def guided_backpropagation(model, img, layer_name='conv2d'):
-    with tf.GradientTape() as tape:
-        inputs = tf.cast(img, tf.float32)
-        tape.watch(inputs)
-        outputs = model(inputs)[0]
+    heatmap = tf.squeeze(conv_output[0] @ pooled_grads[..., tf.newaxis])
+    heatmap = tf.maximum(heatmap, 0) / (tf.reduce_max(heatmap) + 1e-8)
 
-    grads = tape.gradient(outputs, inputs)[0]
-    return grads.numpy()
+    guided_grads = guided_tape.gradient(class_channel, x)[0]
+    return preds[0][0], heatmap, guided_grads
 
-def apply_guided_gradcam(image_bytes, model, last_conv_layer_name='mixed8'):
-    img_array = preprocess_image(image_bytes)
-    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    heatmap = make_gradcam_heatmap(img_array, model, last_conv_layer_name)
-    guided_grads = guided_backpropagation(model, img_array)
+# Trace the graph once at startup so the first request doesn't pay for it
+infer_and_explain(tf.zeros((1, 256, 256, 3), tf.float32))
 
+def apply_guided_gradcam(img_rgb, heatmap, guided_grads):
     # Resize heatmap to match the size of the guided grads
     heatmap = cv2.resize(heatmap, (guided_grads.shape[1], guided_grads.shape[0]))
-    heatmap = np.expand_dims(heatmap, axis=-1)
 
-    guided_gradcam = guided_grads * heatmap
-    guided_gradcam = np.maximum(guided_gradcam, 0)
-    guided_gradcam = guided_gradcam / np.max(guided_gradcam)
+    # Fused channel reduction: since the heatmap is non-negative,
+    # relu(grads * heatmap) == relu(grads) * heatmap, so the relu is computed
+    # once and the HxWxC product, its relu copy, and the 3D division that the
+    # step-by-step version allocated are collapsed into 2D operations.
+    positive_grads = np.maximum(guided_grads, 0)
+    guided_gradcam = heatmap * positive_grads.sum(axis=-1)
+    peak = (heatmap * positive_grads.max(axis=-1)).max()
+    guided_gradcam /= peak
 
-    # Ensure guided_gradcam has the correct shape
-    guided_gradcam = np.sum(guided_gradcam, axis=-1)
     guided_gradcam = cv2.resize(guided_gradcam, (img_rgb.shape[1], img_rgb.shape[0]))
 
-    # Apply colormap
-    colormap = plt.get_cmap('viridis')
-    guided_gradcam_colored = colormap(guided_gradcam)
-
-    # Convert to RGB and remove alpha channel
-    guided_gradcam_colored = np.delete(guided_gradcam_colored, 3, axis=2)
-
-    return img_rgb, guided_gradcam_colored
+    return img_rgb, guided_gradcam
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -100,10 +178,14 @@ def predict():
         Endpoint to predict pneumonia from a chest X-ray image.
 
         The endpoint accepts a POST request with an image file and returns the diagnosis,
-        confidence level, and a Guided Grad-CAM heatmap in base64 format.
+        confidence level, and a Guided Grad-CAM heatmap in base64 format. Callers that
+        only need the label can pass ?explain=0 to skip the heatmap, since the
+        explanation roughly triples the TF compute per request.
 
         Request:
             - Method: POST
+            - Query string:
+                - explain: Set to 0 to omit the base64 heatmap (optional, default 1).
             - Form-data:
                 - image: The chest X-ray image file to be analyzed.
 
@@ -113,7 +195,7 @@ def predict():
                     'result': "Pneumonia detected with 85.50% confidence",
                     'diagnosis': "Pneumonia detected" or "Normal",
                     'confidence': 0.855,  # Confidence score of the prediction
-                    'heatmap': "<base64_encoded_heatmap_image>"  # Base64 encoded heatmap image
+                    'heatmap': "<base64_encoded_heatmap_image>"  # Omitted with explain=0
                 }
             - 400 Bad Request:
                 {
@@ -134,9 +216,8 @@ def predict():
             return jsonify({'error': 'No image provided'}), 400
 
         img = request.files['image'].read()
-        img_array = preprocess_image(img)
-        model = load_model_once()
-        prediction = model.predict(img_array)[0][0]
+        img_rgb, img_array = decode_and_prep(img)
+        prediction = predict_proba(img_array)
 
         if prediction > 0.5:
             diagnosis = "Pneumonia detected"
@@ -145,31 +226,40 @@ def predict():
             diagnosis = "Normal"
             confidence = 1 - prediction
 
-        confidence = float(confidence)  # Convert float32 to native Python float
-
-        # Generate Guided Grad-CAM heatmap
-        original_img, guided_gradcam = apply_guided_gradcam(img, model)
-
-        # Create a response image with the heatmap
-        pil_img = Image.fromarray((guided_gradcam * 255).astype(np.uint8))
-        buf = io.BytesIO()
-        pil_img.save(buf, format='JPEG')
-        buf.seek(0)
-        heatmap_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-
-        return jsonify({
+        response = {
             'result': f"{diagnosis} with {confidence * 100:.2f}% confidence",
             'diagnosis': diagnosis,
-            'confidence': confidence,
-            'heatmap': heatmap_base64
-        })
+            'confidence': confidence
+        }
+
+        # Heatmap is on by default so existing callers (the Java backend and
+        # the analysis pages) keep working; label-only callers pass explain=0
+        explain = request.args.get('explain', request.form.get('explain', '1')) != '0'
+        if explain:
+            # Generate Guided Grad-CAM heatmap (per-image; the gradient pass
+            # is cheap next to the batched inference above)
+            _, heatmap, guided_grads = infer_and_explain(tf.constant(img_array))
+            original_img, guided_gradcam = apply_guided_gradcam(
+                img_rgb, heatmap.numpy(), guided_grads.numpy())
+
+            # Colorize and JPEG-encode the heatmap with OpenCV (libjpeg-turbo),
+            # avoiding matplotlib's float64 RGBA colormap path and PIL's encoder
+            heatmap_u8 = (np.clip(guided_gradcam, 0, 1) * 255).astype(np.uint8)
+            heatmap_colored = cv2.applyColorMap(heatmap_u8, cv2.COLORMAP_VIRIDIS)
+            _, heatmap_buf = cv2.imencode('.jpg', heatmap_colored, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            response['heatmap'] = base64.b64encode(heatmap_buf.tobytes()).decode('utf-8')
+
+        return jsonify(response)
     except Exception as e:
         app.logger.error('Error during prediction: %s', str(e))
         return jsonify({'error': 'Internal Server Error'}), 500
 
 if __name__ == '__main__':
+    # Development only. In production run under Gunicorn (TF releases the
+    # GIL inside its C++ kernels, so threads give real concurrency):
+    #   gunicorn -w 1 --threads 8 --worker-class gthread --backlog 64 --timeout 60 wsgi:app
     port = int(os.getenv('PORT', 5000))
-    app.run(debug=bool(os.getenv('DEBUG', True)), port=port)
+    app.run(debug=False, port=port)
 
 
 
@@ -0,0 +1,9 @@
+"""Gunicorn entry point for the pneumonia detection API.
+
+Run with:
+    gunicorn -w 1 --threads 8 --worker-class gthread --backlog 64 --timeout 60 wsgi:app
+"""
+from pneumonia_model_api import app
+
+if __name__ == "__main__":
+    app.run()